@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 # whatlastgenre
 # Improves genre metadata of audio files
@@ -45,10 +45,12 @@ setup(
             'whatlastgenre = wlg.whatlastgenre:main'
         ]
     },
+    python_requires='>=3.6',
     install_requires=['mutagen', 'requests'],
     tests_requires=['pytest'],
     extras_require={
         'discogs': ['rauth'],
+        'difflib': ['rapidfuzz>=3'],
         'reqcache': ['requests-cache'],
     },
     classifiers=[
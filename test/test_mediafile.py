@@ -25,7 +25,10 @@ import tempfile
 import time
 import unittest
 
-from wlg.mediafile import Album, find_music_dirs, VA_MBID
+from mutagen.id3 import ID3
+
+from wlg.mediafile import Album, Track, find_music_dirs, \
+    is_various_artists, map_key, VA_MBID
 
 DATA_PATH = os.path.abspath(os.path.join('test', 'data'))
 
@@ -54,8 +57,23 @@ class TestMediafile(unittest.TestCase):
 
     def test_find_music_dirs(self):
         paths = find_music_dirs([self.temp_path])
+        self.assertIsInstance(paths, list)
         self.assertIn(self.temp_path, paths)
 
+    def test_map_key(self):
+        for _ in range(2):  # second run uses memoized keys
+            self.assertEqual(map_key('flac', 'album'), 'ALBUM')
+            self.assertEqual(map_key('mp3', 'albumartist'), 'performer')
+            self.assertIsNone(map_key('m4a', 'label'))
+            self.assertEqual(map_key('m4a', 'album'), 'album')
+
+    def test_is_various_artists(self):
+        for name in ['VA', 'various', 'Various Artists', 'variousartist']:
+            self.assertTrue(is_various_artists(name, None))
+        for name in [None, '', 'Artist', 'Vangelis', 'various people']:
+            self.assertFalse(is_various_artists(name, None))
+        self.assertTrue(is_various_artists('Artist', VA_MBID))
+
     def test_album_get_metadata(self):
         album = self.get_album()
 
@@ -128,6 +146,13 @@ class TestMediafile(unittest.TestCase):
         values = ['Artist A', 'Artist B', 'Artist C']
         album.set_meta('artist', '; '.join(values))
         self.assertEqual(album.get_meta('artist'), values[0])
+        track = album.tracks[0]
+        for sep in ['; ', '\n', '\\']:
+            track.set_meta('genre', sep.join(values))
+            self.assertEqual(track.get_meta('genre'), values)
+        # only the first separator found in order of precedence is used
+        track.set_meta('genre', 'Foo; AC\\DC')
+        self.assertEqual(track.get_meta('genre'), ['Foo', 'AC\\DC'])
 
     def test_get_and_set_date_tag(self):
         album = self.get_album()
@@ -156,6 +181,30 @@ class TestMediafile(unittest.TestCase):
         track.set_meta('genre', genre)
         track.save()
         self.assertEqual(track.get_meta('genre'), genre)
+        self.assertEqual(ID3(track.fullpath).version[:2], (2, 3))
+        track = Track(self.temp_path, track.filename, ';')
+        self.assertEqual(track.get_meta('genre'), genre)
+
+    def test_track_unknown_extension(self):
+        track = self.get_track('flac')
+        filename = track.filename + '.unknown'
+        shutil.copy(track.fullpath, os.path.join(self.temp_path, filename))
+        try:
+            track = Track(self.temp_path, filename)
+            self.assertEqual(track.get_meta('album'),
+                             self.get_track('flac').get_meta('album'))
+        finally:
+            os.remove(os.path.join(self.temp_path, filename))
+
+    def test_save_preserves_modtime(self):
+        for ext in ['flac', 'm4a', 'mp3', 'ogg']:
+            track = self.get_track(ext)
+            genre = [str(time.time())]
+            track.set_meta('genre', genre)
+            self.assertTrue(track.save())
+            self.assertEqual(os.stat(track.fullpath).st_mtime,
+                             track.stat.st_mtime)
+            self.assertEqual(self.get_track(ext).get_meta('genre'), genre)
 
     def test_album_save(self):
         self.get_album().save()
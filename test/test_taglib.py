@@ -21,11 +21,17 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 import re
 import unittest
+from difflib import get_close_matches
 from random import randint
 
-from wlg.whatlastgenre import Config, TagLib
+from wlg.whatlastgenre import Config, TagLib, trigram_index
 from . import get_config
 
+try:
+    import rapidfuzz
+except ImportError:
+    rapidfuzz = None
+
 WHITELIST = [
     'alternative',
     'blues',
@@ -96,6 +102,32 @@ class TestTagLib(unittest.TestCase):
         pos_scores = [x for x in scored_tags.values() if x > 0]
         self.assertEqual(len(tags) - 1, len(pos_scores))
 
+    def test_resolve(self):
+        for raw, done in [('hip hop', 'hip-hop'),
+                          ('triphop', 'trip-hop'),
+                          ('rock', 'rock')]:
+            self.assertEqual(done, self.taglib.resolve(raw))
+
+    def test_resolve_regex_groups(self):
+        named = [(re.compile(r'(?P<x>a)cid', re.I), r'\g<x>cid'),
+                 (re.compile(r'(?P<x>j)azz', re.I), r'\g<x>azz')]
+        backref = [(re.compile(r'(x)y', re.I), r'\1'),
+                   (re.compile(r'(\w)\1', re.I), r'\1')]
+        for regexes in [named, backref, named + backref]:
+            taglib = TagLib(self.taglib.conf, WHITELIST,
+                            dict(TAGSFILE, regex=regexes))
+            self.assertIsNone(taglib.regex_any)
+            self.assertEqual('acid', taglib.resolve('acid'))
+        self.assertEqual('rock', taglib.resolve('rrock'))
+
+    def test_resolve_shared(self):
+        resolved = {}
+        taglib = TagLib(self.taglib.conf, WHITELIST, TAGSFILE, resolved)
+        taglib.resolve('hip hop')
+        self.assertEqual({'hip hop': 'hip-hop'}, resolved)
+        taglib = TagLib(self.taglib.conf, WHITELIST, TAGSFILE, resolved)
+        self.assertEqual('hip-hop', taglib.resolve('hip hop'))
+
     def test_difflib_matching(self):
         tags = {
             'blues': 1,
@@ -108,6 +140,47 @@ class TestTagLib(unittest.TestCase):
             self.assertIsNone(key)
             self.assertIsNone(match)
 
+    def test_difflib_matching_match(self):
+        tags = {'alternativ': 1, 'progresive': 1}
+        self.assertEqual(sorted(self.taglib.difflib_matching(tags)),
+                         [('alternativ', 'alternative'),
+                          ('progresive', 'progressive')])
+
+    def test_difflib_matching_ties(self):
+        whitelist = ['c-gothic', 'j-gothic', 'k-gothic', 'cha-cha-cha']
+        taglib = TagLib(self.taglib.conf, whitelist, TAGSFILE)
+        tags = {'-gothic': 1, 'cha-ha-cha': 1}
+        self.assertEqual(list(taglib.difflib_matching(tags)),
+                         [('-gothic', 'k-gothic')])
+
+    @unittest.skipIf(rapidfuzz is None, 'rapidfuzz not installed')
+    def test_difflib_matching_rapidfuzz(self):
+        whitelist = WHITELIST + ['c-gothic', 'x-gothic', 'cha-cha-cha']
+        taglib = TagLib(self.taglib.conf, whitelist, TAGSFILE)
+        keys = ['-gothic', 'x-gothc', 'cha-ha-cha', 'alternativ',
+                'progresive', 'hip-hopp', 'electronik', 'regae']
+        expected = {}
+        for key in keys:
+            match = get_close_matches(key, whitelist, 1, .92)
+            if match:
+                expected[key] = match[0]
+        self.assertTrue(expected)
+        self.assertEqual(dict(taglib.difflib_matching(dict.fromkeys(keys, 1))),
+                         expected)
+
+    def test_difflib_candidates(self):
+        candidates = self.taglib.difflib_candidates('progresive')
+        self.assertIn('progressive', candidates)
+        self.assertNotIn('jazz', candidates)
+
+    def test_difflib_candidates_shared(self):
+        trigrams = trigram_index(WHITELIST)
+        self.assertEqual({'progressive'}, trigrams['siv'])
+        taglib = TagLib(self.taglib.conf, WHITELIST, TAGSFILE,
+                        trigrams=trigrams)
+        self.assertIn('progressive', taglib.difflib_candidates('progresive'))
+        self.assertIs(trigrams, taglib.trigrams)
+
     def test_split(self):
         tags = [
             'pop/country',
@@ -153,6 +226,15 @@ class TestTagLib(unittest.TestCase):
         # check normalized score
         self.assertEqual(1, max(merged_tags.values()))
 
+    def test_merge_rounding(self):
+        scoremod = self.taglib.conf.getfloat('scores', 'artist')
+        self.taglib.taggrps['artist'].update({'pop': .01, 'rock': .03})
+        self.taglib.taggrps['album'].update({'jazz': .5})
+        merged_tags = self.taglib.merge()
+        # same operations as normalizing each group first
+        self.assertEqual(.01 / .03 * scoremod / scoremod, merged_tags['pop'])
+        self.assertEqual(.5 / .5 / scoremod, merged_tags['jazz'])
+
     def test_format(self):
         test_data = [
             ('nu jazz', 'Nu Jazz'),
@@ -173,3 +255,11 @@ class TestTagLib(unittest.TestCase):
         self.taglib.conf.args.tag_limit = limit
         self.taglib.add({'rock': 1, 'pop': 1, 'jazz': 1}, 'album')
         self.assertEqual(limit, len(self.taglib.get_genres()))
+
+    def test_get_genres_love_hate(self):
+        conf = self.taglib.conf
+        conf.set('genres', 'love', 'jazz')
+        conf.set('genres', 'hate', 'rock')
+        self.taglib = TagLib(conf, WHITELIST, TAGSFILE)
+        self.taglib.add({'rock': 1, 'jazz': 0.6}, 'album')
+        self.assertEqual(['Jazz', 'Rock'], self.taglib.get_genres())
@@ -27,12 +27,28 @@ import unittest
 from tempfile import NamedTemporaryFile
 
 from wlg import whatlastgenre
-from wlg.dataprovider import DataProvider
+from wlg.dataprovider import DataProvider, DataProviderError
 from wlg.mediafile import Metadata
 from . import get_config
 from .test_mediafile import DATA_PATH
 
 
+class FakeDataProvider(DataProvider):
+    """DataProvider answering artist queries without any requests."""
+
+    def query_artist(self, artist):
+        if artist == 'error':
+            raise DataProviderError('test error')
+        return [{'tags': {'rock': 1}}]
+
+
+class LoginDataProvider(FakeDataProvider):
+    """FakeDataProvider that would ask the user for credentials."""
+
+    def login(self):
+        raise AssertionError('login in prefetch')
+
+
 class TestWhatLastGenreClass(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -58,6 +74,8 @@ class TestWhatLastGenreClass(unittest.TestCase):
         self.assertIn('upper', tagsfile.keys())
         self.assertIn('alias', tagsfile.keys())
         self.assertIn('regex', tagsfile.keys())
+        self.assertIn('edm', tagsfile['upper'])
+        self.assertEqual('hip-hop', tagsfile['alias']['hip hop'])
 
     def test_read_tagsfile_doesnt_exist(self):
         with self.assertRaises(IOError):
@@ -115,6 +133,24 @@ class TestWhatLastGenreClass(unittest.TestCase):
         self.assertTrue(cached)
         del self.wlg.cache.cache[str(self.wlg.cache.cachekey(query))]
 
+    def test_prefetch(self):
+        daprs = [FakeDataProvider(), FakeDataProvider(), LoginDataProvider()]
+        daprs[1].name = 'FakeDataProvider2'
+        queries = [whatlastgenre.Query(
+            dapr=dapr, type='artist', str=artist, score=1, artist=artist,
+            mbid_artist=None, album='', mbid_album='', mbid_relgrp='',
+            year=None, releasetype=None)
+            for dapr in daprs for artist in ['prefetch test', 'error']]
+        prefetched = self.wlg.prefetch(queries)
+        self.assertEqual(4, len(prefetched))
+        res, cached = self.wlg.cached_query(queries[0], prefetched)
+        self.assertFalse(cached)
+        self.assertEqual([{'tags': {'rock': 1}}], res)
+        with self.assertRaises(DataProviderError):
+            self.wlg.cached_query(queries[1], prefetched)
+        self.assertEqual(2, len(prefetched))
+        del self.wlg.cache.cache[str(self.wlg.cache.cachekey(queries[0]))]
+
     def test_create_queries_with_albumartist(self):
         metadata = Metadata(
             path='/tmp',
@@ -182,6 +218,11 @@ class TestWhatLastGenre(unittest.TestCase):
             self.assertGreater(val, 0)
         self.assertEqual(len(preprocessed_tags), 1)
 
+    def test_preprocess_tags_duplicates(self):
+        tags = {'rock': 10, 'Rock': 5, ' ROCK ': 1, 'pop': 3}
+        preprocessed_tags = whatlastgenre.preprocess_tags(tags)
+        self.assertEqual(preprocessed_tags, {'rock': 16, 'pop': 3})
+
     def test_preprocess_tags_many_without_scores(self):
         tags = {'tag%s' % i: 0 for i in range(100)}
         preprocessed_tags = whatlastgenre.preprocess_tags(tags)
@@ -202,6 +243,11 @@ class TestWhatLastGenre(unittest.TestCase):
                                         '%4d %-20s')
         self.assertIsNotNone(res)
 
+    def test_tag_display_columns(self):
+        tags = [('a', 1), ('b', 2), ('c', 3), ('d', 4)]
+        res = whatlastgenre.tag_display(tags, '%d %s')
+        self.assertEqual('1 a 3 c\n2 b 4 d', res)
+
     def test_tag_display_empty(self):
         res = whatlastgenre.tag_display({}, '')
         self.assertEqual(res, '')
@@ -23,20 +23,32 @@ Read and write metadata of audio files using mutagen.
 from __future__ import print_function, unicode_literals
 
 import os.path
-import re
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import mutagen
+import mutagen.easymp4
+import mutagen.flac
+import mutagen.mp3
+import mutagen.oggvorbis
 
 # supported extensions
-EXTENSIONS = ['.flac', '.ogg', '.mp3', '.m4a']
+EXTENSIONS = ('.flac', '.ogg', '.mp3', '.m4a')
 
-# regex pattern for 'Various Artist'
-VA_PAT = re.compile('^va(rious( ?artists?)?)?$', re.I)
+# lowercase names of 'Various Artists'
+VA_NAMES = frozenset(['va', 'various', 'variousartist', 'variousartists',
+                      'various artist', 'various artists'])
 
 # musicbrainz artist id of 'Various Artists'
 VA_MBID = '89ad4ac3-39f7-470e-963a-56509c546377'
 
+# separators of values in CSV tags, in order of precedence
+CSV_SEPS = (';', '\n', '\\')
+
+# separators of date parts, like in 2001-05-31 or 2001/05/31,
+# in order of precedence
+DATE_SEPS = ('/', '-')
+
 # metadata key mapping {ext: {old: new}}
 MAPPING = {
     'mp3': {
@@ -55,6 +67,20 @@ MAPPING = {
     },
 }
 
+# mutagen classes by extension, saves mutagen.File guessing the type
+LOADERS = {
+    'flac': mutagen.flac.FLAC,
+    'ogg': mutagen.oggvorbis.OggVorbis,
+    'mp3': mutagen.mp3.EasyMP3,
+    'm4a': mutagen.easymp4.EasyMP4,
+}
+
+# thread pool shared by all albums for loading and saving tracks
+EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4))
+
+# memoized results of map_key {ext: {key: mapped key}}
+KEYMAP = {}
+
 Metadata = namedtuple(
     'Metadata', ['path', 'type', 'artists', 'albumartist', 'album',
                  'mbid_album', 'mbid_relgrp', 'year', 'releasetype'])
@@ -63,35 +89,53 @@ Metadata = namedtuple(
 def find_music_dirs(paths):
     """Scan paths for directories containing supported music files."""
     dirs = []
-    for path in paths:
-        for root, _, files in os.walk(path):
-            if any(os.path.splitext(f)[1].lower() in EXTENSIONS
-                   for f in files):
-                dirs.append(root)
+    stack = list(paths)
+    while stack:
+        path = stack.pop()
+        music = False
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    # like os.walk: don't follow symlinked directories
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            stack.append(entry.path)
+                    elif not music:
+                        music = entry.name.lower().endswith(EXTENSIONS)
+        except OSError:
+            continue
+        if music:
+            dirs.append(path)
     return dirs
 
 
 def is_various_artists(name, mbid):
     """Check if given name or mbid represents 'Various Artists'."""
-    return name and VA_PAT.match(name) or mbid == VA_MBID
+    return bool(name) and name.lower() in VA_NAMES or mbid == VA_MBID
 
 
 def map_key(ext, key):
     """Map metadata key."""
-    if ext in MAPPING and key in MAPPING[ext]:
-        key = MAPPING[ext][key]
-    if ext in ['flac', 'ogg']:
-        key = key.upper()
-    return key
+    keymap = KEYMAP.setdefault(ext, {})
+    if key not in keymap:
+        mapped = MAPPING.get(ext, {}).get(key, key)
+        if mapped and ext in ['flac', 'ogg']:
+            mapped = mapped.upper()
+        keymap[key] = mapped
+    return keymap[key]
+
+
+def split_first(value, separators):
+    """Split value by the first of some separators it contains."""
+    for sep in separators:
+        if sep in value:
+            return value.split(sep)
+    return [value]
 
 
 def get_first(iterable, default=None):
     """Get the first not None item from an iterable or default."""
-    if iterable:
-        for item in iterable:
-            if item:
-                return item
-    return default
+    return next(filter(None, iterable or ()), default)
 
 
 class AlbumError(Exception):
@@ -107,17 +151,25 @@ class Album(object):
             raise AlbumError("Directory vanished")
         self.path = path
         self.tracks = []
-        for file_ in os.listdir(path):
-            if os.path.splitext(file_)[1].lower() in EXTENSIONS:
-                try:
-                    self.tracks.append(Track(path, file_, v23sep))
-                except TrackError as err:
-                    print("Error loading track '%s': %s" % (file_, err))
+        futures = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(EXTENSIONS) \
+                        or not entry.is_file():
+                    continue
+                # load tracks concurrently to overlap their file access
+                futures.append((entry.name, EXECUTOR.submit(
+                    Track, path, entry.name, v23sep)))
+        for filename, future in futures:
+            try:
+                self.tracks.append(future.result())
+            except TrackError as err:
+                print("Error loading track '%s': %s" % (filename, err))
         if not self.tracks:
             raise AlbumError("Could not load any tracks")
         if not self.get_meta('album'):
             raise AlbumError("Not all tracks have the same or any album-tag")
-        self.type = ','.join(set(t.ext for t in self.tracks)).upper()
+        self.type = ','.join(sorted({t.ext for t in self.tracks})).upper()
 
     def get_metadata(self):
         """Return a Metadata namedtuple."""
@@ -153,14 +205,21 @@ class Album(object):
         :param key: metadata key
         :param lcp: use longest common prefix for some keys
         """
-        values = [get_first(t.get_meta(key)) for t in self.tracks]
-        values = [v for v in values if v]
+        lcp = lcp and key in ['artist', 'albumartist', 'album']
+        values = set()
+        for track in self.tracks:
+            value = get_first(track.get_meta(key))
+            if value:
+                values.add(value)
+                # differing values without lcp, no need to look further
+                if len(values) > 1 and not lcp:
+                    return None
         # common for all tracks
-        if len(set(values)) == 1:
-            return values[0]
+        if len(values) == 1:
+            return values.pop()
         # use longest common prefix
-        if values and lcp and key in ['artist', 'albumartist', 'album']:
-            val = os.path.commonprefix(values).strip()
+        if values and lcp:
+            val = os.path.commonprefix(list(values)).strip()
             if len(val) > 2:
                 return val
         # no common value for this key
@@ -175,9 +234,11 @@ class Album(object):
         """Save all tracks."""
         print("Saving metadata... ", end='')
         dirty = False
-        for track in self.tracks:
+        # save tracks concurrently to overlap their file writes
+        futures = [(t, EXECUTOR.submit(t.save)) for t in self.tracks]
+        for track, future in futures:
             try:
-                dirty = track.save() or dirty
+                dirty = future.result() or dirty
             except TrackError as err:
                 print("Error saving track '%s': %s" % (track.filename, err))
         print("done!" if dirty else "(no changes)")
@@ -195,37 +256,52 @@ class Track(object):
         self.fullpath = os.path.join(path, filename)
         self.filename = filename
         self.v23sep = v23sep
-        self.ext = os.path.splitext(filename)[1].lower()[1:]
+        self.ext = filename.rsplit('.', 1)[-1].lower()
         self.dirty = False
+        self.meta = {}  # cached metadata values by mapped key
         try:
             self.stat = os.stat(self.fullpath)
-            self.muta = mutagen.File(self.fullpath, easy=True)
-        except (IOError, OSError) as err:
+            self.muta = self._load()
+        except (IOError, OSError, mutagen.MutagenError) as err:
             raise TrackError(err)
         if not self.muta:
             raise TrackError('unknown mutagen error')
 
-    def get_meta(self, key):
-        """Get metadata for a given key."""
+    def _load(self):
+        """Load the file with the mutagen class matching its extension.
 
-        def split(value, separators):
-            """Split value by some separators."""
-            for sep in separators:
-                if sep in value:
-                    return [v.strip() for v in value.split(sep)]
-            return [value]
+        Fall back to mutagen.File for other extensions or content,
+        like opus in .ogg.
+        """
+        loader = LOADERS.get(self.ext)
+        if loader:
+            try:
+                return loader(self.fullpath)
+            except mutagen.MutagenError:
+                pass
+        return mutagen.File(self.fullpath, easy=True)
 
+    def get_meta(self, key):
+        """Get metadata for a given key."""
         key = map_key(self.ext, key)
+        if key not in self.meta:
+            self.meta[key] = self._read_meta(key)
+        return self.meta[key]
+
+    def _read_meta(self, key):
+        """Read metadata for a given mapped key from mutagen."""
         if not key or key not in self.muta or not self.muta[key]:
             return None
         values = self.muta[key]
         # CSV tags
         if len(set(values)) == 1:
-            sep = [self.v23sep] if self.v23sep else [';', '\n', '\\']
-            values = split(values[0], sep)
+            seps = [self.v23sep] if self.v23sep else CSV_SEPS
+            parts = split_first(values[0], seps)
+            if len(parts) > 1:
+                values = [v.strip() for v in parts]
         # date tags
         if key.lower() in ['date']:
-            values = [split(v, ['/', '-'])[0] for v in values]
+            values = [split_first(v, DATE_SEPS)[0].strip() for v in values]
         return values
 
     def set_meta(self, key, val):
@@ -237,13 +313,17 @@ class Track(object):
         if not val:
             if key in self.muta:
                 del self.muta[key]
+                self.meta.pop(key, None)
                 self.dirty = True
             return
         if not isinstance(val, list):
             val = [val]
-        # check for change
-        if val != self.get_meta(key):
+        # check for change, key is already mapped
+        if key not in self.meta:
+            self.meta[key] = self._read_meta(key)
+        if val != self.meta[key]:
             self.muta[key] = val
+            self.meta.pop(key, None)
             self.dirty = True
 
     def save(self):
@@ -255,15 +335,22 @@ class Track(object):
         """
         if not self.dirty:
             return False
+        times = (self.stat.st_atime, self.stat.st_mtime)
         try:
-            self.muta.save()
-            # downgrade id3 v2.4 tags to v2.3 if separator is set
-            if self.ext == 'mp3' and self.v23sep:
-                from mutagen.id3 import ID3
-                audio = ID3(self.fullpath, v2_version=3)
-                audio.save(v2_version=3, v23_sep=self.v23sep + ' ')
-            # preserve modtime
-            os.utime(self.fullpath, (self.stat.st_atime, self.stat.st_mtime))
-        except IOError as err:
+            # open the file once and let mutagen write to that handle
+            with open(self.fullpath, 'r+b') as file_:
+                # write id3 v2.3 tags if separator is set
+                if self.ext == 'mp3' and self.v23sep:
+                    self.muta.save(file_, v2_version=3,
+                                   v23_sep=self.v23sep + ' ')
+                else:
+                    self.muta.save(file_)
+                file_.flush()
+                # preserve modtime
+                if os.utime in os.supports_fd:
+                    os.utime(file_.fileno(), times)
+                    return True
+            os.utime(self.fullpath, times)
+        except (IOError, mutagen.MutagenError) as err:
             raise TrackError(err)
         return True
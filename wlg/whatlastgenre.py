@@ -25,6 +25,8 @@ from __future__ import absolute_import, division, print_function, \
 
 import argparse
 import configparser
+import functools
+import heapq
 import itertools
 import logging
 import math
@@ -35,6 +37,7 @@ import re
 import sys
 import time
 from collections import defaultdict, Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
 from . import __version__, cache, dataprovider, mediafile
@@ -45,6 +48,20 @@ Query = namedtuple(
 
 Stats = namedtuple('Stats', ['time', 'messages', 'genres', 'reltyps'])
 
+# patterns to remove from strings for searching
+SEARCHSTR_PATTERNS = [re.compile(pat) for pat in [
+    r'\(.*\)$', r'\[.*\]', '{.*}', "- .* -", "'.*'", '".*"',
+    ' (- )?(album|single|ep|official remix(es)?|soundtrack|ost)$',
+    r'[ \(]f(ea)?t(\.|uring)? .*', r'vol(\.|ume)? ',
+    # punctuation and multiple spaces in one pass
+    '[!?/:;, ]+']]
+
+# backreferences in regex patterns, like \1, (?P=name) or (?(1)...)
+BACKREF_PAT = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+# lines of already read package data files {path: lines}
+PACKAGE_DATA = {}
+
 
 class WhatLastGenre(object):
     """Main class featuring a docstring that needs to be written."""
@@ -54,19 +71,27 @@ class WhatLastGenre(object):
         self.log.setLevel(30 - 10 * conf.args.verbose)
         self.log.addHandler(logging.StreamHandler(sys.stdout))
         self.stats = Stats(time=time.time(),
-                           messages=defaultdict(list),
+                           messages=defaultdict(set),
                            genres=Counter(),
                            reltyps=Counter())
         self.conf = conf
         self.cache = cache.Cache(self.conf.path, self.conf.args.update_cache)
         self.daprs = self.init_dataproviders()
+        self.dapr_scores = {
+            dapr: self.conf.getfloat('scores', 'src_%s' % dapr.name.lower())
+            for dapr in self.daprs}
         self.whitelist = self.read_whitelist()
         self.tags = self.read_tagsfile()
+        self.resolved = {}  # resolved tags shared by all TagLibs
+        # whitelist trigram index shared by all TagLibs
+        self.trigrams = None
+        if self.conf.args.difflib:
+            self.trigrams = trigram_index(self.whitelist)
 
     def read_whitelist(self, path=None):
         """Read the whitelist trying different paths.
 
-        Return a set of whitelist entries.
+        Return a frozenset of whitelist entries.
         """
         if not path:
             if self.conf.has_option('wlg', 'whitelist') \
@@ -76,7 +101,7 @@ class WhatLastGenre(object):
                 path = os.path.join(self.conf.path, 'genres.txt')
             else:
                 path = 'data/genres.txt'
-        whitelist = set(read_datafile(path))
+        whitelist = frozenset(read_datafile(path))
         if not whitelist:
             raise RuntimeError('empty whitelist: %s' % path)
         self.log.debug('whitelist: %s (%d items)', path, len(whitelist))
@@ -98,18 +123,19 @@ class WhatLastGenre(object):
         tagsfile = {}
         section = None
         for line in read_datafile(path):
-            line = str(line.strip().lower())
             if line.startswith('[') and line.endswith(']'):
                 section = line[1:-1]
                 tagsfile[section] = []
-            elif line and not line.startswith('#') and section:
+            elif not line.startswith('#') and section:
                 if ' = ' in line:
                     line = tuple(line.split(' = ', 2))
                 tagsfile[section].append(line)
         if any(s not in tagsfile.keys()
                for s in ['upper', 'alias', 'regex']):
             raise RuntimeError('missing section in tagsfile: %s' % path)
-        for key, val in tagsfile['alias']:
+        tagsfile['upper'] = frozenset(tagsfile['upper'])
+        tagsfile['alias'] = dict(tagsfile['alias'])
+        for key, val in tagsfile['alias'].items():
             if val not in self.whitelist:
                 self.stat_message(logging.WARN, 'alias not whitelisted',
                                   '%s -> %s' % (key, val), 2)
@@ -175,11 +201,12 @@ class WhatLastGenre(object):
         """Query for top genres of an album identified by metadata
         and return them and some releaseinfo."""
 
-        def log_string(query, cached, status):
-            """Return a string for logging."""
-            return "%-8s %-6s got %13s for '%s'%s" % \
-                   (query.dapr.name, query.type, status, query.str,
-                    " (cached)" if cached else '')
+        def log_status(query, cached, status):
+            """Log the status of a query if info logging is enabled."""
+            if self.log.isEnabledFor(logging.INFO):
+                self.log.info("%-8s %-6s got %13s for '%s'%s",
+                              query.dapr.name, query.type, status,
+                              query.str, " (cached)" if cached else '')
 
         num_artists = 1
         if not metadata.albumartist[0]:
@@ -188,13 +215,16 @@ class WhatLastGenre(object):
                       metadata.type, metadata.albumartist[0], metadata.album,
                       metadata.year, (" (%d artists)" % num_artists
                                       if num_artists > 1 else ''))
-        taglib = TagLib(self.conf, self.whitelist, self.tags)
+        taglib = TagLib(self.conf, self.whitelist, self.tags, self.resolved,
+                        self.trigrams)
         release = None
-        for query in self.create_queries(metadata):
+        queries = self.create_queries(metadata)
+        prefetched = self.prefetch(queries)
+        for query in queries:
             if not query.str:
                 continue
             try:
-                results, cached = self.cached_query(query)
+                results, cached = self.cached_query(query, prefetched)
             except NotImplementedError:
                 continue
             except dataprovider.DataProviderError as err:
@@ -209,7 +239,7 @@ class WhatLastGenre(object):
                     self.stat_message(logging.DEBUG, '%s: no %s results'
                                       % (query.dapr.name, query.type),
                                       metadata.path)
-                self.log.info(log_string(query, cached, "no results"))
+                log_status(query, cached, "no results")
                 continue
             # ask user if appropriated
             if len(results) > 1 and not self.conf.args.dry \
@@ -230,8 +260,7 @@ class WhatLastGenre(object):
                     self.stat_message(logging.DEBUG, '%s: too many %s results'
                                       % (query.dapr.name, query.type),
                                       metadata.path)
-                self.log.info(log_string(query, cached,
-                                         "%2d results" % len(results)))
+                log_status(query, cached, "%2d results" % len(results))
                 continue
             # unique result
             query.dapr.stats['results'] += 1
@@ -264,7 +293,7 @@ class WhatLastGenre(object):
                 elif self.conf.args.release:
                     self.stat_message(logging.ERROR, 'No releaseinfo found',
                                       metadata.path, 1)
-            self.log.info(log_string(query, cached, status))
+            log_status(query, cached, status)
 
         genres = taglib.get_genres()
         if genres:
@@ -280,8 +309,52 @@ class WhatLastGenre(object):
                               metadata.path, 1)
         return genres, release
 
-    def cached_query(self, query):
-        """Perform a cached DataProvider query."""
+    def prefetch(self, queries):
+        """Perform the uncached queries of multiple DataProviders
+        concurrently.
+
+        Every DataProvider gets its own thread and runs its queries
+        in order, so their rate limits and sessions are still honored.
+        DataProviders that log in lazily may ask the user for credentials,
+        so their queries are left to the main thread.
+        Return a dict of {cachekey: (result, error)} for cached_query.
+        """
+        pending = defaultdict(list)
+        cachekeys = set()
+        for query in queries:
+            if not query.str or hasattr(query.dapr, 'login'):
+                continue
+            cachekey = self.cache.cachekey(query)
+            if cachekey not in cachekeys and not self.cache.get(cachekey):
+                cachekeys.add(cachekey)
+                pending[query.dapr].append((cachekey, query))
+        if len(pending) < 2:
+            return {}
+
+        def run(items):
+            """Perform the queries of a single DataProvider."""
+            results = {}
+            for cachekey, query in items:
+                try:
+                    results[cachekey] = (self.query(query), None)
+                except (NotImplementedError,
+                        dataprovider.DataProviderError) as err:
+                    # reraised in cached_query
+                    results[cachekey] = (None, err)
+            return results
+
+        prefetched = {}
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            for results in executor.map(run, pending.values()):
+                prefetched.update(results)
+        return prefetched
+
+    def cached_query(self, query, prefetched=None):
+        """Perform a cached DataProvider query.
+
+        :param query: the Query to perform
+        :param prefetched: optional results of prefetch
+        """
         cachekey = self.cache.cachekey(query)
         # check cache
         res = self.cache.get(cachekey)
@@ -289,7 +362,12 @@ class WhatLastGenre(object):
             query.dapr.stats['reqs_cache'] += 1
             return res[1], True
         # no cache hit
-        res = self.query(query)
+        if prefetched and cachekey in prefetched:
+            res, err = prefetched.pop(cachekey)
+            if err:
+                raise err
+        else:
+            res = self.query(query)
         self.cache.set(cachekey, res)
         # save cache periodically
         if time.time() - self.cache.time > 600:
@@ -337,9 +415,8 @@ class WhatLastGenre(object):
         queries = []
         # album queries
         for dapr in self.daprs:
-            score = self.conf.getfloat('scores', 'src_%s' % dapr.name.lower())
             queries.append(Query(
-                dapr=dapr, type='album', score=score,
+                dapr=dapr, type='album', score=self.dapr_scores[dapr],
                 str=(albumartist + ' ' + album).strip(),
                 artist=albumartist, mbid_artist=metadata.albumartist[1],
                 album=album, mbid_album=metadata.mbid_album,
@@ -349,10 +426,8 @@ class WhatLastGenre(object):
         if metadata.albumartist[0]:
             if self.conf.getfloat('scores', 'artist') > 0.0:
                 for dapr in self.daprs:
-                    score = self.conf.getfloat('scores',
-                                               'src_%s' % dapr.name.lower())
                     queries.append(Query(
-                        dapr=dapr, type='artist', score=score,
+                        dapr=dapr, type='artist', score=self.dapr_scores[dapr],
                         str=albumartist.strip(),
                         artist=albumartist,
                         mbid_artist=metadata.albumartist[1],
@@ -362,12 +437,11 @@ class WhatLastGenre(object):
         elif self.conf.getfloat('scores', 'various') > 0.0:
             for key, val in set(artists):
                 artist = searchstr(key)
+                count = artists.count((key, val))
                 for dapr in self.daprs:
-                    score = self.conf.getfloat('scores',
-                                               'src_%s' % dapr.name.lower())
                     queries.append(Query(
                         dapr=dapr, type='artist', str=artist.strip(),
-                        score=artists.count((key, val)) * score,
+                        score=count * self.dapr_scores[dapr],
                         artist=artist, mbid_artist=val,
                         album='', mbid_album='', mbid_relgrp='',
                         year='', releasetype=''))
@@ -376,10 +450,10 @@ class WhatLastGenre(object):
     @classmethod
     def merge_results(cls, results):
         """Merge multiple results."""
-        tags = defaultdict(float)
-        for tags_ in [r['tags'] for r in results if 'tags' in r]:
-            for key, val in tags_.items():
-                tags[key] += val
+        tags = Counter()
+        for res in results:
+            if res.get('tags'):
+                tags.update(res['tags'])
         result = {'tags': tags}
         for key in set(k for r in results for k in r.keys() if k != 'tags'):
             vals = [r[key] for r in results if key in r and r[key]]
@@ -389,8 +463,8 @@ class WhatLastGenre(object):
 
     def stat_message(self, level, message, item, log=None):
         """Record a message in the stats and optionally log it."""
-        self.stats.messages[(level, message)].append(item)
-        if log:
+        self.stats.messages[(level, message)].add(item)
+        if log and self.log.isEnabledFor(level):
             if log > 1:
                 message += ': ' + item
             self.log.log(level, message)
@@ -414,7 +488,7 @@ class WhatLastGenre(object):
                           key=lambda x: (x[0][0], len(x[1])), reverse=True)
         for (lvl, msg), items in messages:
             if self.log.level <= lvl:
-                items = sorted(set(items))
+                items = sorted(items)
                 print("\n%s (%d):\n  %s"
                       % (msg, len(items), '\n  '.join(items)))
         # dataprovider
@@ -428,13 +502,34 @@ class WhatLastGenre(object):
 class TagLib(object):
     """Class to handle tags."""
 
-    def __init__(self, conf, whitelist, tags):
+    def __init__(self, conf, whitelist, tags, resolved=None, trigrams=None):
         self.log = logging.getLogger(__name__)
         self.conf = conf
         self.whitelist = whitelist
+        # memoized results of resolve, may be shared between TagLibs
+        self.resolved = {} if resolved is None else resolved
         self.aliases = tags['alias']
         self.regexes = tags['regex']
-        self.upper = tags['upper']
+        # all regex patterns in one to quickly skip tags that don't match,
+        # unless backreferences, group names or inline flags would clash
+        self.regex_any = None
+        if self.regexes and not any(BACKREF_PAT.search(pat.pattern)
+                                    for pat, _ in self.regexes):
+            try:
+                self.regex_any = re.compile('|'.join(
+                    '(?:%s)' % pat.pattern for pat, _ in self.regexes), re.I)
+            except re.error:
+                pass
+        self.upper = frozenset(tags['upper'])
+        self.trigrams = trigrams  # whitelist trigram index for difflib
+        # config values used for every tag
+        self.splitup = conf.getfloat('scores', 'splitup')
+        self.minimum = conf.getfloat('scores', 'minimum')
+        self.love = self.hate = frozenset()
+        if conf.has_option('genres', 'love'):
+            self.love = frozenset(conf.get_list('genres', 'love'))
+        if conf.has_option('genres', 'hate'):
+            self.hate = frozenset(conf.get_list('genres', 'hate'))
         self.taggrps = {'artist': defaultdict(float),
                         'album': defaultdict(float),
                         'various': defaultdict(float)}
@@ -449,9 +544,12 @@ class TagLib(object):
         :param split: was split already
         """
         good = 0
+        whitelist = self.whitelist
+        taggrp = self.taggrps[group]
+        debug = self.log.isEnabledFor(logging.DEBUG)
         for key, val in tags.items():
             # resolve if not whitelisted
-            if key not in self.whitelist:
+            if key not in whitelist:
                 key = self.resolve(key)
             # split if wasn't yet
             splitgood = 0
@@ -462,20 +560,24 @@ class TagLib(object):
                     val = base
             # filter unscored
             if val < .001:
-                self.log.debug('tag noscore %s', key)
+                if debug:
+                    self.log.debug('tag noscore %s', key)
                 continue
-            self.log.debug('tag score   %s %.3f', key, val)
+            if debug:
+                self.log.debug('tag score   %s %.3f', key, val)
             # filter
-            if key not in self.whitelist:
-                self.log.debug('tag filter  %s', key)
+            if key not in whitelist:
+                if debug:
+                    self.log.debug('tag filter  %s', key)
                 continue
             # was not good for splitting, but still good for itself
             # avoid counting as good multiple times due to splitting
             if not splitgood:
                 good += 1
             # add
-            self.taggrps[group][key] += val
-            self.log.debug('tag add     %s', key)
+            taggrp[key] += val
+            if debug:
+                self.log.debug('tag add     %s', key)
         return good
 
     def score(self, tags, scoremod):
@@ -490,52 +592,92 @@ class TagLib(object):
         else:
             val = max(1 / 3, .85 ** (len(tags) - 1)) * scoremod
             tags = {k: val for k in tags.keys()}
-        self.log.debug('tagscoring min/avg/max (num) = %.3f/%.3f/%.3f (%d)',
-                       min(tags.values()),
-                       sum(tags.values()) / len(tags),
-                       max(tags.values()), len(tags))
+        # these stats take three more passes, only do them for debugging
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(
+                'tagscoring min/avg/max (num) = %.3f/%.3f/%.3f (%d)',
+                min(tags.values()), sum(tags.values()) / len(tags),
+                max(tags.values()), len(tags))
         return tags
 
     def resolve(self, key):
         """Try to resolve a tag to a valid whitelisted tag by using
-        aliases, regex replacements and optional difflib matching.
+        aliases and regex replacements.
         """
+        if key not in self.resolved:
+            self.resolved[key] = self._resolve(key)
+        return self.resolved[key]
+
+    def _resolve(self, key):
+        """Resolve a tag, see resolve."""
 
         def alias(key):
-            """Return whether a key got an alias and log it if True."""
-            if key in self.aliases:
-                self.log.debug('tag alias   %s -> %s', key,
-                               self.aliases[key])
-                return True
-            return False
+            """Return the alias of a key (if any) and log it."""
+            val = self.aliases.get(key)
+            if val:
+                self.log.debug('tag alias   %s -> %s', key, val)
+            return val
 
         # alias
-        if alias(key):
-            return self.aliases[key]
+        val = alias(key)
+        if val:
+            return val
         # regex
-        if any(r[0].search(key) for r in self.regexes):
+        if self.regex_any:
+            matched = self.regex_any.search(key)
+        else:
+            matched = any(pat.search(key) for pat, _ in self.regexes)
+        if matched:
             for pat, repl in self.regexes:
-                if pat.search(key):
-                    key_ = key
-                    key = pat.sub(repl, key)
+                key_ = key
+                key, num = pat.subn(repl, key)
+                if num:
                     self.log.debug('tag replace %s -> %s (%s)',
                                    key_, key, pat.pattern)
             # key got replaced, try alias again
-            if alias(key):
-                return self.aliases[key]
-            return key
+            return alias(key) or key
         return key
 
     def difflib_matching(self, tags):
-        """Use difflib to find some whitelist matches."""
+        """Use difflib to find some whitelist matches.
+
+        Use the much faster rapidfuzz to preselect candidates if it is
+        installed.
+        """
         from difflib import get_close_matches
+        try:  # use optional rapidfuzz if available
+            from rapidfuzz import fuzz, process
+        except ImportError:
+            process = None
         for key in tags.keys():
             if key not in self.whitelist and key not in self.aliases:
-                match = get_close_matches(key, self.whitelist, 1, .92)
+                candidates = self.difflib_candidates(key)
+                if not candidates:
+                    continue
+                if process:
+                    # rapidfuzz's ratio is never lower than difflib's,
+                    # so it only narrows down the candidates for difflib
+                    candidates = [m[0] for m in process.extract(
+                        key, candidates, scorer=fuzz.ratio, processor=None,
+                        score_cutoff=91, limit=None)]
+                match = get_close_matches(key, candidates, 1, .92)
                 if match:
                     self.log.debug('tag match   %s -> %s', key, match[0])
                     yield key, match[0]
 
+    def difflib_candidates(self, key):
+        """Return the whitelist entries sharing a trigram with a key.
+
+        Tags similar enough for difflib matching always share trigrams,
+        so the others don't need to be compared at all.
+        """
+        if len(key) < 3:
+            return self.whitelist
+        if self.trigrams is None:
+            self.trigrams = trigram_index(self.whitelist)
+        return set().union(*(self.trigrams.get(key[i:i + 3], ())
+                             for i in range(len(key) - 2)))
+
     def split(self, key, val, group):
         """Split a tag into its parts and add them."""
 
@@ -549,26 +691,29 @@ class TagLib(object):
                     return True
             return False
 
+        def parts(sep):
+            """Return the stripped parts of key longer than 2 chars."""
+            return [k for k in (k.strip() for k in key.split(sep))
+                    if len(k) > 2]
+
         keys = []
         good = 0
         base = val
         flag = True
         if '/' in key:  # all delimiters got replaced with / earlier
-            keys = [k.strip() for k in key.split('/') if len(k.strip()) > 2]
+            keys = parts('/')
             flag = False
         elif ' ' in key and not dont_split(key):
-            keys = [k.strip() for k in key.split(' ') if len(k.strip()) > 2]
+            keys = parts(' ')
             if len(keys) > 2:
                 # build all combinations with length 1 to 3, requires
                 # at least 3 words, permutations would be overkill
-                combis = []
-                for length in range(1, min(4, len(keys))):
-                    for combi in itertools.combinations(keys, length):
-                        combis.append(' '.join(combi))
-                keys = combis
-            base = val * self.conf.getfloat('scores', 'splitup')
+                keys = [' '.join(combi)
+                        for length in range(1, min(4, len(keys)))
+                        for combi in itertools.combinations(keys, length)]
+            base = val * self.splitup
         elif '-' in key and key not in self.whitelist:
-            keys = [k.strip() for k in key.split('-') if len(k.strip()) > 2]
+            keys = parts('-')
         # add the parts
         if keys:
             self.log.debug('tag split   %s -> %s', key, ', '.join(keys))
@@ -593,20 +738,16 @@ class TagLib(object):
                 scoremod = self.conf.getfloat('scores', group)
                 if scoremod == 0.0:
                     continue
-            tags = self.normalize(tags)
+            # normalize and apply scoremod in one pass, in the same order
+            # as normalize, so scores at the minimum round the same way
+            max_ = max(tags.values())
             for key, val in tags.items():
-                mergedtags[key] += val * scoremod
+                mergedtags[key] += val / max_ * scoremod
         return self.normalize(mergedtags)
 
     def format(self, key):
         """Format a tag to correct case."""
-        words = key.split(' ')
-        for i, word in enumerate(words):
-            if len(word) < 3 and word != 'nu' or word in self.upper:
-                words[i] = word.upper()
-            else:
-                words[i] = word.title()
-        return ' '.join(words)
+        return format_tag(key, self.upper)
 
     def get_genres(self):
         """Return the formatted names of the limited top genres.
@@ -616,31 +757,32 @@ class TagLib(object):
         for group, tags in self.taggrps.items():
             if not tags:
                 continue
-            tags = self.normalize(tags)
-            tags = {self.format(k): v for k, v in tags.items()}
-            tags = sorted(tags.items(), key=operator.itemgetter(1), reverse=1)
             self.log.info('Best %-6s genres (%d):' % (group, len(tags)))
-            self.log.info(tag_display(tags[:9], '%4.2f %-20s'))
+            tags = heapq.nlargest(9, self.normalize(tags).items(),
+                                  key=operator.itemgetter(1))
+            tags = [(self.format(k), v) for k, v in tags]
+            self.log.info(tag_display(tags, '%4.2f %-20s'))
         tags = self.merge()
         if not tags:
             return []
         # apply user score bonus
         for key in tags.keys():
-            if self.conf.has_option('genres', 'love') \
-                    and key in self.conf.get_list('genres', 'love'):
+            if key in self.love:
                 tags[key] *= 2.0
-            elif self.conf.has_option('genres', 'hate') \
-                    and key in self.conf.get_list('genres', 'hate'):
+            elif key in self.hate:
                 tags[key] *= 0.5
-        tags = self.normalize(tags)
-        # filter low scored tags
-        tags = {k: v for k, v in tags.items()
-                if v >= self.conf.getfloat('scores', 'minimum')}
-        tags = {self.format(k): v for k, v in tags.items()}
-        tags = sorted(tags.items(), key=operator.itemgetter(1), reverse=1)
+        # normalize and filter low scored tags in one pass
+        max_ = max(tags.values())
+        tags = {k: v / max_ for k, v in tags.items()
+                if v / max_ >= self.minimum}
         self.log.info('Best merged genres (%d):' % len(tags))
+        # only the best tags get displayed and used, no need to sort all
+        limit = self.conf.args.tag_limit
+        tags = heapq.nlargest(max(9, limit), tags.items(),
+                              key=operator.itemgetter(1))
+        tags = [(self.format(k), v) for k, v in tags]
         self.log.info(tag_display(tags[:9], '%4.2f %-20s'))
-        return [k for k, _ in tags[:self.conf.args.tag_limit]]
+        return [k for k, _ in tags[:limit]]
 
 
 class Config(configparser.ConfigParser):
@@ -737,9 +879,12 @@ def preprocess_tags(tags):
     """
     if not tags:
         return tags
-    tags = {k.strip().lower(): v for k, v in tags.items()}
-    tags = {k: v for k, v in tags.items()
-            if len(k) in range(2, 64) and v >= 0}
+    # merge tags that only differ in case or surrounding whitespace
+    merged = defaultdict(int)
+    for key, val in tags.items():
+        merged[key.strip().lower()] += val
+    tags = {k: v for k, v in merged.items()
+            if 2 <= len(k) < 64 and v >= 0}
     # answer to the ultimate question of life, the universe,
     # the optimal number of considerable tags and everything
     limit = 42
@@ -757,35 +902,53 @@ def preprocess_tags(tags):
     return tags
 
 
+@functools.lru_cache(maxsize=1024)
 def searchstr(str_):
     """Clean up a string for use in searching."""
     if not str_:
         return ''
     str_ = str_.lower()
-    for pat in [r'\(.*\)$', r'\[.*\]', '{.*}', "- .* -", "'.*'", '".*"',
-                ' (- )?(album|single|ep|official remix(es)?|soundtrack|ost)$',
-                r'[ \(]f(ea)?t(\.|uring)? .*', r'vol(\.|ume)? ',
-                '[!?/:;,]', ' +']:
-        sub = re.sub(pat, ' ', str_).strip()
+    for pat in SEARCHSTR_PATTERNS:
+        sub = pat.sub(' ', str_).strip()
         if sub:  # don't remove everything
             str_ = sub
     return str_
 
 
+def trigram_index(whitelist):
+    """Index whitelist entries by their character trigrams."""
+    trigrams = defaultdict(set)
+    for tag in whitelist:
+        for i in range(len(tag) - 2):
+            trigrams[tag[i:i + 3]].add(tag)
+    return trigrams
+
+
+@functools.lru_cache(maxsize=1024)
+def format_tag(key, upper):
+    """Format a tag to correct case.
+
+    :param key: tag name
+    :param upper: frozenset of words which should be uppercase
+    """
+    words = key.split(' ')
+    for i, word in enumerate(words):
+        if len(word) < 3 and word != 'nu' or word in upper:
+            words[i] = word.upper()
+        else:
+            words[i] = word.title()
+    return ' '.join(words)
+
+
 def tag_display(tags, pattern):
     """Return a string of tags formatted in columns."""
     # pattern should not exceed (80-2)/3=26 chars length
     columns = 3
     num_lines = int(math.ceil(len(tags) / columns))
-    lines = []
-    for line in range(num_lines):
-        values = []
-        for column in range(columns):
-            index = line + num_lines * column
-            if index < len(tags):
-                values.append(pattern % tuple(reversed(tags[index])))
-        lines.append(' '.join(values))
-    return '\n'.join(lines)
+    cells = [pattern % (val, key) for key, val in tags]
+    # fill the columns top to bottom, every line takes every nth cell
+    return '\n'.join(' '.join(cells[line::num_lines])
+                     for line in range(num_lines))
 
 
 def ask_user(dapr_name, query_type, results):
@@ -823,11 +986,14 @@ def progressbar(current, total):
 def read_datafile(path):
     """Read a file that might be package data."""
     if path.startswith('data/'):
-        lines = pkgutil.get_data('wlg', path).decode().splitlines()
-    else:
-        with open(path, 'r') as file_:
-            lines = file_.read().splitlines()
-    return [l.strip().lower() for l in lines if l.strip()]
+        if path not in PACKAGE_DATA:
+            lines = pkgutil.get_data('wlg', path).decode().splitlines()
+            PACKAGE_DATA[path] = [line.strip().lower() for line in lines
+                                  if line.strip()]
+        return list(PACKAGE_DATA[path])
+    with open(path, 'r') as file_:
+        lines = file_.read().splitlines()
+    return [line.strip().lower() for line in lines if line.strip()]
 
 
 def get_args():
@@ -864,13 +1030,13 @@ def main():
     args = get_args()
     conf = Config(args)
     wlg = WhatLastGenre(conf)
-    paths = mediafile.find_music_dirs(args.path)
+    paths = sorted(mediafile.find_music_dirs(args.path))
     print("\nFound %d music directories!" % len(paths))
     if not paths:
         return
     i = 1
     try:
-        for i, path in enumerate(sorted(paths), start=1):
+        for i, path in enumerate(paths, start=1):
             print('\n' + progressbar(i, len(paths)))
             print(path)
             wlg.progress_path(path)